@@ -1,10 +1,15 @@
 import streamlit as st
 import os
-import json
+import orjson
 import math
+import time
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import urllib.parse
 import re
+import numpy as np
+import concurrent.futures
 from typing import Dict, List, Tuple
 import google.generativeai as genai
 
@@ -16,6 +21,28 @@ GEMINI_API_KEY = st.secrets["GEMINI_API_KEY"]
 UBIKE_JSON = "HsinChu_Ubike.json"
 DISTANCE_MATRIX_URL = "https://maps.googleapis.com/maps/api/distancematrix/json"
 DIRECTIONS_URL = "https://maps.googleapis.com/maps/api/directions/json"
+_LATLNG_RE = re.compile(r"-?\d+(?:\.\d+)?,-?\d+(?:\.\d+)?")
+
+# 共用連線池，避免每次請求都重新建立 TCP/TLS 連線（跨 rerun 與使用者共用）
+@st.cache_resource
+def _get_session() -> requests.Session:
+    session = requests.Session()
+    session.mount("https://", HTTPAdapter(
+        pool_connections=4,
+        pool_maxsize=8,
+        max_retries=Retry(total=3, backoff_factor=0.3, status_forcelist=[429, 500, 502, 503, 504]),
+    ))
+    return session
+
+# 共用的 API 請求執行緒池，避免每次規劃都重新建立執行緒
+@st.cache_resource
+def _api_executor() -> concurrent.futures.ThreadPoolExecutor:
+    return concurrent.futures.ThreadPoolExecutor(max_workers=8)
+
+@st.cache_resource
+def _get_gemini_model():
+    genai.configure(api_key=GEMINI_API_KEY)
+    return genai.GenerativeModel("gemini-2.5-flash")
 
 
 def haversine(lat1, lon1, lat2, lon2):
@@ -27,38 +54,80 @@ def haversine(lat1, lon1, lat2, lon2):
     a = math.sin(dphi/2)**2 + math.cos(phi1)*math.cos(phi2)*math.sin(dlambda/2)**2
     return 2 * R * math.asin(math.sqrt(a))
 
+def _to_float(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
 @st.cache_data
-def load_ubike_data(path=UBIKE_JSON) -> List[Dict]:
+def load_ubike_data(path=UBIKE_JSON) -> Tuple[List[Dict], Dict[str, np.ndarray]]:
     if not os.path.exists(path):
         st.error(f"找不到檔案：{path}，請確認檔案位置。")
-        return []
+        return [], {}
     
-    with open(path, "r", encoding="utf-8") as f:
-        data = json.load(f)
-    normalized = []
-    for item in data:
-        try:
-            normalized.append({
-                "name": item.get("站點名稱"),
-                "lat": float(item.get("緯度")),
-                "lng": float(item.get("經度")),
-                "addr": item.get("站點位置"),
-                "img": item.get("圖片")
-            })
-        except Exception:
-            continue
-    return normalized
-
-def find_nearest_ubike(user_lat: float, user_lng: float, ubike_list: List[Dict], top_k=1):
-    distances = []
-    for ub in ubike_list:
-        d = haversine(user_lat, user_lng, ub["lat"], ub["lng"])
-        distances.append((d, ub))
-    distances.sort(key=lambda x: x[0])
-    return [u[1] for u in distances[:top_k]]
+    with open(path, "rb") as f:
+        data = orjson.loads(f.read())
+    # 經緯度缺漏或格式錯誤的資料先過濾掉
+    rows = [
+        (item, _to_float(item.get("緯度")), _to_float(item.get("經度")))
+        for item in data
+        if isinstance(item, dict)
+    ]
+    normalized = [
+        {
+            "name": item.get("站點名稱"),
+            "lat": lat,
+            "lng": lng,
+            "addr": item.get("站點位置"),
+            "img": item.get("圖片")
+        }
+        for item, lat, lng in rows
+        if lat is not None and lng is not None
+    ]
+    # 站點座標另存為陣列，並預先計算弧度與 cos(lat)，供向量化距離計算使用
+    lats = np.array([ub["lat"] for ub in normalized], dtype=np.float32)
+    lngs = np.array([ub["lng"] for ub in normalized], dtype=np.float32)
+    phi = np.radians(lats)
+    coords = {
+        "lat": lats,
+        "lng": lngs,
+        "phi": phi,
+        "cos_phi": np.cos(phi),
+        "lng_rad": np.radians(lngs),
+    }
+    return normalized, coords
+
+def find_nearest_ubike(user_lat: float, user_lng: float, ubike_list: List[Dict], coords: Dict[str, np.ndarray], top_k=1):
+    R = 6371000
+    phi1 = math.radians(user_lat)
+    dphi = coords["phi"] - phi1
+    dlambda = coords["lng_rad"] - math.radians(user_lng)
+    a = np.sin(dphi/2)**2 + math.cos(phi1)*coords["cos_phi"]*np.sin(dlambda/2)**2
+    d = 2 * R * np.arcsin(np.sqrt(a))
+
+    if top_k == 1:
+        return [ubike_list[int(np.argmin(d))]]
+    if top_k < len(d):
+        idx = np.argpartition(d, top_k)[:top_k]
+    else:
+        idx = np.arange(len(d))
+    idx = idx[np.argsort(d[idx])]
+    return [ubike_list[i] for i in idx]
 
 # Google Maps API
-def google_distance_matrix(origins: List[str], destinations: List[str], mode: str="walking") -> Dict:
+class GoogleApiError(RuntimeError):
+    pass
+
+def _check_api_status(data: Dict) -> Dict:
+    # Google 以 HTTP 200 回傳 OVER_QUERY_LIMIT 等錯誤；拋出例外，避免 st.cache_data 快取失敗結果
+    status = data.get("status")
+    if status not in ("OK", "ZERO_RESULTS"):
+        raise GoogleApiError(f"Google API 錯誤：{status} {data.get('error_message', '')}".strip())
+    return data
+
+@st.cache_data(ttl=1800, max_entries=512, show_spinner=False)
+def google_distance_matrix(origins: Tuple[str, ...], destinations: Tuple[str, ...], mode: str="walking") -> Dict:
     params = {
         "origins": "|".join(origins),
         "destinations": "|".join(destinations),
@@ -66,10 +135,11 @@ def google_distance_matrix(origins: List[str], destinations: List[str], mode: st
         "key": GOOGLE_MAPS_API_KEY,
         "language": "zh-TW",
     }
-    resp = requests.get(DISTANCE_MATRIX_URL, params=params, timeout=10)
+    resp = _get_session().get(DISTANCE_MATRIX_URL, params=params, timeout=10)
     resp.raise_for_status()
-    return resp.json()
+    return _check_api_status(orjson.loads(resp.content))
 
+@st.cache_data(ttl=1800, max_entries=512, show_spinner=False)
 def google_directions(origin: str, destination: str, mode: str="bicycling") -> Dict:
     params = {
         "origin": origin,
@@ -78,56 +148,95 @@ def google_directions(origin: str, destination: str, mode: str="bicycling") -> D
         "key": GOOGLE_MAPS_API_KEY,
         "language": "zh-TW",
     }
-    resp = requests.get(DIRECTIONS_URL, params=params, timeout=10)
+    resp = _get_session().get(DIRECTIONS_URL, params=params, timeout=10)
     resp.raise_for_status()
-    return resp.json()
+    return _check_api_status(orjson.loads(resp.content))
 
 def generate_maps_link(origin: str, destination: str, mode: str) -> str:
     base_url = "https://www.google.com/maps/dir/?api=1" 
-    safe_origin = urllib.parse.quote(origin)
-    safe_dest = urllib.parse.quote(destination)
+    # plan_route 組出的 "lat,lng" 字串本身即可直接放進網址，不需再 quote
+    safe_origin = origin if _LATLNG_RE.fullmatch(origin) else urllib.parse.quote(origin)
+    safe_dest = destination if _LATLNG_RE.fullmatch(destination) else urllib.parse.quote(destination)
     return f"{base_url}&origin={safe_origin}&destination={safe_dest}&travelmode={mode}"
 
 #Google Gemini API
-def call_gemini(summary):
-    genai.configure(api_key=GEMINI_API_KEY)
-    model = genai.GenerativeModel("gemini-2.5-flash")
-    summary_for_ai = summary.copy()
-    if 'links' in summary_for_ai:
-        del summary_for_ai['links']
+def _fmt_seconds(t) -> str:
+    return "無資料" if t is None else f"{t}s"
 
+def call_gemini(summary):
+    # 只整理 Gemini 需要的欄位，縮短 prompt；此字串同時作為快取鍵，相同路線不重複呼叫 Gemini
+    # 缺少的時間標示為「無資料」，避免 Gemini 誤以為是 0 秒
+    t1 = summary['walk_to_ubike'].get('duration_s')
+    t2 = summary['bike_leg'].get('duration_s')
+    t3 = summary['walk_from_ubike'].get('duration_s')
+    tt = summary['transit_option'].get('duration_s')
+    ubike_total = f"={t1 + t2 + t3}s" if None not in (t1, t2, t3) else ""
+    if tt is None:
+        transit_text = "無資料"
+    else:
+        transit_text = f"{tt}s ({summary['transit_option'].get('summary', '')})"
+    summary_text = (
+        f"Ubike方案({summary['ubike_start']['name']}→{summary['ubike_end']['name']}):"
+        f"步行{_fmt_seconds(t1)}+騎車{_fmt_seconds(t2)}+步行{_fmt_seconds(t3)}{ubike_total}; "
+        f"公車方案:{transit_text}"
+    )
+    return _cached_gemini(summary_text)
+
+@st.cache_data(ttl=3600, max_entries=256, show_spinner=False)
+def _cached_gemini(summary_text: str) -> str:
+    model = _get_gemini_model()
     prompt = f"""
     請你用中文，把以下交通路線資訊整理成清楚易懂的自然語言，給出建議：
     - 比較「Ubike + 步行」與「純公車」的總時間
     - 推薦理由（時間、轉乘、舒適度）
     - 語氣友善簡潔，適合一般民眾閱讀。
     輸入資料：
-    {json.dumps(summary_for_ai, ensure_ascii=False, indent=2)}
+    {summary_text}
     """
     response = model.generate_content(prompt)
     return response.text
 
 def parse_dm(dm):
+    if "error" in dm:
+        return {"error": dm["error"]}
     try:
         el = dm["rows"][0]["elements"][0]
-        if el.get("status") != "OK":
-            return {}
-        return {
-            "distance_text": el.get("distance", {}).get("text"),
-            "distance_m": el.get("distance", {}).get("value"),
-            "duration_text": el.get("duration", {}).get("text"),
-            "duration_s": el.get("duration", {}).get("value"),
-            "status": el.get("status"),
-        }
-    except Exception:
+    except (KeyError, IndexError, TypeError):
+        return {}
+    if el.get("status") != "OK":
         return {}
+    dist = el.get("distance") or {}
+    dur = el.get("duration") or {}
+    return {
+        "distance_text": dist.get("text"),
+        "distance_m": dist.get("value"),
+        "duration_text": dur.get("text"),
+        "duration_s": dur.get("value"),
+        "status": "OK",
+    }
+
+def _fast_bike_estimate(a: Dict, b: Dict) -> Dict:
+    # 以直線距離與約 15 km/h (4.17 m/s) 估算騎車時間，省去一次 API 請求
+    d = haversine(a["lat"], a["lng"], b["lat"], b["lng"])
+    return {"distance_m": int(d), "duration_s": int(d / 4.17)}
+
+def _future_result(fut) -> Dict:
+    # 單一請求失敗時回傳錯誤原因，不影響其他請求；
+    # requests 的例外訊息含有帶 API key 的網址，只記錄在伺服器端，畫面上顯示通用訊息
+    try:
+        return fut.result()
+    except GoogleApiError as e:
+        return {"error": str(e)}
+    except Exception as e:
+        print(f"API request failed: {str(e).replace(GOOGLE_MAPS_API_KEY, '***')}")
+        return {"error": "連線失敗，請稍後再試"}
 
-def plan_route(user_origin: Tuple[float,float], user_destination: Tuple[float,float], ubike_list: List[Dict]) -> Dict:
+def plan_route(user_origin: Tuple[float,float], user_destination: Tuple[float,float], ubike_list: List[Dict], coords: Dict[str, np.ndarray], precise_bike: bool=False) -> Dict:
     origin_lat, origin_lng = user_origin
     dest_lat, dest_lng = user_destination
 
-    nearest_from = find_nearest_ubike(origin_lat, origin_lng, ubike_list, top_k=3)
-    nearest_to = find_nearest_ubike(dest_lat, dest_lng, ubike_list, top_k=3)
+    nearest_from = find_nearest_ubike(origin_lat, origin_lng, ubike_list, coords, top_k=1)
+    nearest_to = find_nearest_ubike(dest_lat, dest_lng, ubike_list, coords, top_k=1)
 
     ubike_start = nearest_from[0]
     ubike_end = nearest_to[0]
@@ -137,27 +246,41 @@ def plan_route(user_origin: Tuple[float,float], user_destination: Tuple[float,fl
     dest_str = f"{dest_lat},{dest_lng}"
     end_str = f"{ubike_end['lat']},{ubike_end['lng']}"
 
-    dm1 = google_distance_matrix([ori_str], [start_str], mode="walking")
-    dm2 = google_distance_matrix([start_str], [end_str], mode="bicycling") 
-    dm3 = google_distance_matrix([end_str], [dest_str], mode="walking")
-    
-    transit = google_directions(ori_str, dest_str, mode="transit")
+    # Google API 請求彼此獨立，平行送出
+    executor = _api_executor()
+    fut_walk1 = executor.submit(google_distance_matrix, (ori_str,), (start_str,), mode="walking")
+    fut_walk2 = executor.submit(google_distance_matrix, (end_str,), (dest_str,), mode="walking")
+    fut_transit = executor.submit(google_directions, ori_str, dest_str, mode="transit")
+    fut_bike = None
+    if precise_bike:
+        fut_bike = executor.submit(google_distance_matrix, (start_str,), (end_str,), mode="bicycling")
+
+    dm_walk1 = _future_result(fut_walk1)
+    dm_walk2 = _future_result(fut_walk2)
+    transit = _future_result(fut_transit)
 
     link_walk_to_station = generate_maps_link(ori_str, start_str, "walking")
     link_bike_ride = generate_maps_link(start_str, end_str, "bicycling")
     link_walk_to_dest = generate_maps_link(end_str, dest_str, "walking")
     link_transit = generate_maps_link(ori_str, dest_str, "transit")
 
-    walk_to_ubike = parse_dm(dm1)
-    bike_leg = parse_dm(dm2)
-    walk_from_ubike = parse_dm(dm3)
+    walk_to_ubike = parse_dm(dm_walk1)
+    if fut_bike is not None:
+        bike_leg = parse_dm(_future_result(fut_bike))
+    else:
+        bike_leg = _fast_bike_estimate(ubike_start, ubike_end)
+    walk_from_ubike = parse_dm(dm_walk2)
 
     transit_info = {}
     try:
+        if "error" in transit:
+            raise RuntimeError(transit["error"])
         troute = transit["routes"][0]
         tlegs = troute.get("legs", [])
         total_seconds = sum([leg.get("duration", {}).get("value", 0) for leg in tlegs])
         transit_info = {"duration_s": total_seconds, "summary": troute.get("summary", "")}
+    except RuntimeError as e:
+        transit_info = {"error": str(e)}
     except Exception:
         transit_info = {}
 
@@ -179,24 +302,33 @@ def plan_route(user_origin: Tuple[float,float], user_destination: Tuple[float,fl
     }
     return summary
 
+@st.cache_data(ttl=86400, max_entries=2048, show_spinner=False)
+def geocode_address(addr: str) -> Tuple[float, float]:
+    # 查無結果時直接拋出例外，避免把失敗結果寫入快取
+    geocode_resp = google_directions(addr, addr, mode="walking")
+    loc = geocode_resp["routes"][0]["legs"][0]["start_location"]
+    return loc["lat"], loc["lng"]
+
 def input_latlng(s):
     if not s:
         return None
+    s = s.strip()
     
-    pattern = r"^(-?\d+(\.\d+)?),\s*(-?\d+(\.\d+)?)$"
-    match = re.match(pattern, s.strip())
-
-    if match:
-        try:
-            return float(match.group(1)), float(match.group(3))
-        except ValueError:
-            pass
+    if "," in s:
+        parts = s.split(",")
+        if len(parts) == 2:
+            try:
+                lat, lng = float(parts[0].strip()), float(parts[1].strip())
+            except ValueError:
+                lat = lng = None
+            # 排除 nan / inf 與超出範圍的值，交給地址解析處理
+            if (lat is not None and math.isfinite(lat) and math.isfinite(lng)
+                    and -90 <= lat <= 90 and -180 <= lng <= 180):
+                return lat, lng
     
-    # Google Geocoding
+    # Google Geocoding（正規化後查詢，提高快取命中率）
     try:
-        geocode_resp = google_directions(s, s, mode="walking")
-        loc = geocode_resp["routes"][0]["legs"][0]["start_location"]
-        return loc["lat"], loc["lng"]
+        return geocode_address(s.lower())
     except Exception:
         return None
 
@@ -206,7 +338,7 @@ def scrape_weather_final():
     try:
         url = "https://wttr.in/Hsinchu?m&format=%t|%C"
         
-        resp = requests.get(url, timeout=10)
+        resp = _get_session().get(url, timeout=10)
         
         if resp.status_code == 200:
             data = resp.text.strip().split("|")
@@ -219,11 +351,62 @@ def scrape_weather_final():
         return "N/A", "N/A"
 
 
+@st.cache_resource
+def _weather_executor() -> concurrent.futures.ThreadPoolExecutor:
+    return concurrent.futures.ThreadPoolExecutor(max_workers=1)
+
+def _weather_pending() -> bool:
+    # 收下已完成的抓取結果（保留最後一次成功的讀數）；讀數超過快取時間才送出新的抓取。
+    # 回傳是否仍有抓取進行中
+    fut = st.session_state.get("weather_future")
+    if fut is not None and fut.done():
+        result = fut.result()
+        if result != ("N/A", "N/A") or "weather_last" not in st.session_state:
+            st.session_state["weather_last"] = result
+        st.session_state["weather_fetched_at"] = time.time()
+        st.session_state["weather_future"] = fut = None
+    # 與 scrape_weather_final 的快取時間 (600 秒) 一致
+    if fut is None and time.time() - st.session_state.get("weather_fetched_at", 0) >= 600:
+        fut = _weather_executor().submit(scrape_weather_final)
+        st.session_state["weather_future"] = fut
+    return fut is not None
+
+def _show_weather():
+    last = st.session_state.get("weather_last")
+    if last is None:
+        st.info("⏳ 天氣資料載入中...")
+    else:
+        temp, condition = last
+        st.info(f"🌡️ **{temp}** |  ☁️ **{condition}**")
+
+# 只在抓取進行中才使用此 fragment 輪詢；抓取完成後整頁重跑一次，
+# 改以一般區塊顯示，整頁重跑也會清掉 fragment 的定時器
+@st.fragment(run_every=2)
+def _render_weather_polling():
+    # 同一次整頁執行中 main() 已檢查過，只有 fragment 自行重跑時才再檢查，避免中斷整頁執行
+    if not st.session_state.pop("weather_checked", False) and not _weather_pending():
+        st.rerun()
+    _show_weather()
+
+# 以 fragment 包住 Gemini 區塊；目前區塊內沒有元件，僅在日後加入互動元件時才會只重跑這一段
+@st.fragment
+def _render_gemini_block(summary):
+    st.subheader("🤖 Gemini 路線分析與建議")
+    with st.spinner("Gemini 正在撰寫分析報告..."):
+        gemini_resp = call_gemini(summary)
+        st.markdown(gemini_resp)
+
+def _plan_complete(summary: Dict) -> bool:
+    legs = (summary["walk_to_ubike"], summary["bike_leg"], summary["walk_from_ubike"])
+    if any(leg.get("duration_s") is None for leg in legs):
+        return False
+    return "error" not in summary["transit_option"]
+
 def main():
     st.title("🚲 新竹 Ubike 智慧導航")
 
     # 載入資料
-    ubike_list = load_ubike_data()
+    ubike_list, coords = load_ubike_data()
     if not ubike_list:
         return
 
@@ -236,106 +419,146 @@ def main():
     # weather
     with st.sidebar:
         st.header("🌤️ 新竹即時天氣")
-        temp, condition = scrape_weather_final()
-        st.info(f"🌡️ **{temp}** |  ☁️ **{condition}**")
+        # 天氣在背景抓取，不阻塞主畫面
+        if _weather_pending():
+            st.session_state["weather_checked"] = True
+            _render_weather_polling()
+        else:
+            _show_weather()
         st.caption("資料來源：wttr.in")
 
     use_gemini = st.checkbox("使用 Gemini 分析路線", value=False)
+    precise_bike = st.checkbox("精確騎車時間", value=False)
+
+    # 按鈕一律重新規劃（Google 回應本身已有快取）；其他元件觸發的 rerun 才沿用 session_state 中的結果
+    plan_key = (origin_input, dest_input, precise_bike)
 
     # 開始規劃
     if st.button("🚀 開始規劃", type="primary"):
         with st.spinner("正在搜尋最佳站點並計算路徑..."):
-            origin = input_latlng(origin_input)
-            destination = input_latlng(dest_input)
+            # 起點與終點的地址解析彼此獨立，平行處理
+            fut_origin = _api_executor().submit(input_latlng, origin_input)
+            fut_dest = _api_executor().submit(input_latlng, dest_input)
+            origin = fut_origin.result()
+            destination = fut_dest.result()
 
             if not origin or not destination:
                 st.error("❌ 無法解析地址，請嘗試輸入更完整的地址或經緯度。")
                 return
             try:
-                summary = plan_route(origin, destination, ubike_list)
-                
-                st.success("✅ 計算完成！")
-                
-                # 顯示地圖
-                map_data = [
-                    {"lat": summary['origin_coords'][0], "lon": summary['origin_coords'][1], "color": "#FF0000"},
-                    {"lat": summary['ubike_start']['lat'], "lon": summary['ubike_start']['lng'], "color": "#00FF00"},
-                    {"lat": summary['ubike_end']['lat'], "lon": summary['ubike_end']['lng'], "color": "#00FF00"},
-                    {"lat": summary['dest_coords'][0], "lon": summary['dest_coords'][1], "color": "#0000FF"},
-                ]
-                st.map(data=map_data, latitude="lat", longitude="lon", color="color", size=20, zoom=13)
-
-                st.subheader("📋 Ubike 路線詳情")
-                c1, c2, c3 = st.columns(3)
-                
-                links = summary.get("links", {})
-                
-                # 計算 Ubike 總時間 (步行1 + 騎車 + 步行2)
-                t1 = summary['walk_to_ubike'].get('duration_s', 0)
-                t2 = summary['bike_leg'].get('duration_s', 0)
-                t3 = summary['walk_from_ubike'].get('duration_s', 0)
-                total_ubike_min = int((t1 + t2 + t3) / 60)
-
-                with c1:
-                    st.markdown("**1. 步行前往借車**")
-                    st.write(f"📍 {summary['ubike_start']['name']}")
-                    st.write(f"⏱️ {summary['walk_to_ubike'].get('duration_text','N/A')}")
-                    st.link_button("步行導航", links.get('walk1'))
-                
-                with c2:
-                    st.markdown("**2. Ubike 騎乘**")
-                    st.write(f"📍 往 {summary['ubike_end']['name']}")
-                    bike_min = int(t2 / 60)
-                    st.write(f"⏱️ 約 {bike_min} 分鐘")
-                    st.link_button("騎車導航", links.get('bike'))
-
-                with c3:
-                    st.markdown("**3. 步行前往終點**")
-                    st.write("🏁 到達目的地")
-                    st.write(f"⏱️ {summary['walk_from_ubike'].get('duration_text','N/A')}")
-                    st.link_button("步行導航", links.get('walk2'))
-                
-                st.info(f"🚲 **Ubike 方案總時間：約 {total_ubike_min} 分鐘**")
-                st.divider()
+                summary = plan_route(origin, destination, ubike_list, coords, precise_bike)
+            except Exception as e:
+                st.error(f"發生錯誤: {str(e)}")
+                return
+        # 只保存每一段都成功取得資料的結果
+        if _plan_complete(summary):
+            st.session_state["last_plan"] = {"key": plan_key, "summary": summary}
+        else:
+            st.session_state.pop("last_plan", None)
+    else:
+        cached = st.session_state.get("last_plan")
+        if not cached or cached["key"] != plan_key:
+            return
+        summary = cached["summary"]
 
-                # 大眾運輸
-                st.subheader("🚌 大眾運輸替代方案")
+    try:
+        # 任何一段查詢失敗時顯示警告，並略過以缺漏資料計算的總時間與比較
+        leg_labels = {
+            "walk_to_ubike": "步行前往借車",
+            "bike_leg": "Ubike 騎乘",
+            "walk_from_ubike": "步行前往終點",
+            "transit_option": "大眾運輸",
+        }
+        failed = [(label, summary[key]["error"]) for key, label in leg_labels.items() if "error" in summary[key]]
+        for label, err in failed:
+            st.warning(f"⚠️ {label}路段查詢失敗：{err}")
+        if not failed:
+            st.success("✅ 計算完成！")
+        
+        # 顯示地圖
+        map_data = [
+            {"lat": summary['origin_coords'][0], "lon": summary['origin_coords'][1], "color": "#FF0000"},
+            {"lat": summary['ubike_start']['lat'], "lon": summary['ubike_start']['lng'], "color": "#00FF00"},
+            {"lat": summary['ubike_end']['lat'], "lon": summary['ubike_end']['lng'], "color": "#00FF00"},
+            {"lat": summary['dest_coords'][0], "lon": summary['dest_coords'][1], "color": "#0000FF"},
+        ]
+        st.map(data=map_data, latitude="lat", longitude="lon", color="color", size=20, zoom=13)
+
+        st.subheader("📋 Ubike 路線詳情")
+        c1, c2, c3 = st.columns(3)
+        
+        links = summary.get("links", {})
+        
+        # 計算 Ubike 總時間 (步行1 + 騎車 + 步行2)
+        t1 = summary['walk_to_ubike'].get('duration_s')
+        t2 = summary['bike_leg'].get('duration_s')
+        t3 = summary['walk_from_ubike'].get('duration_s')
+        ubike_complete = None not in (t1, t2, t3)
+        total_ubike_min = int((t1 + t2 + t3) / 60) if ubike_complete else None
+
+        with c1:
+            st.markdown("**1. 步行前往借車**")
+            st.write(f"📍 {summary['ubike_start']['name']}")
+            st.write(f"⏱️ {summary['walk_to_ubike'].get('duration_text','N/A')}")
+            st.link_button("步行導航", links.get('walk1'))
+        
+        with c2:
+            st.markdown("**2. Ubike 騎乘**")
+            st.write(f"📍 往 {summary['ubike_end']['name']}")
+            if t2 is not None:
+                st.write(f"⏱️ 約 {int(t2 / 60)} 分鐘")
+            else:
+                st.write("⏱️ N/A")
+            st.link_button("騎車導航", links.get('bike'))
+
+        with c3:
+            st.markdown("**3. 步行前往終點**")
+            st.write("🏁 到達目的地")
+            st.write(f"⏱️ {summary['walk_from_ubike'].get('duration_text','N/A')}")
+            st.link_button("步行導航", links.get('walk2'))
+        
+        if ubike_complete:
+            st.info(f"🚲 **Ubike 方案總時間：約 {total_ubike_min} 分鐘**")
+        else:
+            st.warning("⚠️ 部分路段缺少資料，無法計算 Ubike 方案總時間")
+        st.divider()
+
+        # 大眾運輸
+        st.subheader("🚌 大眾運輸替代方案")
+        
+        transit_sec = summary['transit_option'].get('duration_s', 0)
+        transit_link = links.get('transit')
+
+        if transit_sec > 0:
+            transit_min = int(transit_sec / 60)
+            t_col1, t_col2 = st.columns([3, 1])
+            
+            with t_col1:
+                st.write(f"⏱️ **預估時間：約 {transit_min} 分鐘**")
                 
-                transit_sec = summary['transit_option'].get('duration_s', 0)
-                transit_link = links.get('transit')
-
-                if transit_sec > 0:
-                    transit_min = int(transit_sec / 60)
-                    t_col1, t_col2 = st.columns([3, 1])
-                    
-                    with t_col1:
-                        st.write(f"⏱️ **預估時間：約 {transit_min} 分鐘**")
-                        
-                        diff = transit_min - total_ubike_min
-                        if diff > 0:
-                            st.caption(f"💡 Ubike 方案比大眾運輸快約 {diff} 分鐘")
-                        elif diff < 0:
-                            st.caption(f"💡 大眾運輸比 Ubike 方案快約 {abs(diff)} 分鐘")
-                        else:
-                            st.caption("💡 兩種方式時間差不多")
-
-                    with t_col2:
-                        st.link_button("🚌 大眾運輸導航", transit_link)
-                else:
-                    st.warning("⚠️ 查無大眾運輸路線資料")
-
-                st.divider()
-
-                if use_gemini:
-                    st.subheader("🤖 Gemini 路線分析與建議")
-                    with st.spinner("Gemini 正在撰寫分析報告..."):
-                        gemini_resp = call_gemini(summary)
-                        st.markdown(gemini_resp)
-                else:
-                    st.info("💡 您未勾選 AI 助理，已跳過路線分析。")
+                if ubike_complete:
+                    diff = transit_min - total_ubike_min
+                    if diff > 0:
+                        st.caption(f"💡 Ubike 方案比大眾運輸快約 {diff} 分鐘")
+                    elif diff < 0:
+                        st.caption(f"💡 大眾運輸比 Ubike 方案快約 {abs(diff)} 分鐘")
+                    else:
+                        st.caption("💡 兩種方式時間差不多")
+
+            with t_col2:
+                st.link_button("🚌 大眾運輸導航", transit_link)
+        else:
+            st.warning("⚠️ 查無大眾運輸路線資料")
+
+        st.divider()
+
+        if use_gemini:
+            _render_gemini_block(summary)
+        else:
+            st.info("💡 您未勾選 AI 助理，已跳過路線分析。")
 
-            except Exception as e:
-                st.error(f"發生錯誤: {str(e)}")
+    except Exception as e:
+        st.error(f"發生錯誤: {str(e)}")
 
 if __name__ == "__main__":
     main()
\ No newline at end of file